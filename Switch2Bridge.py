@@ -12,6 +12,9 @@ License: MIT
 """
 
 import asyncio
+import collections
+import functools
+import struct
 import threading
 import sys
 
@@ -43,6 +46,20 @@ except ImportError:
     print("   System Settings → Privacy & Security → Accessibility")
     sys.exit(1)
 
+try:
+    import Quartz
+    from pynput._util.darwin import get_unicode_to_keycode_map
+    _event_source = Quartz.CGEventSourceCreate(
+        Quartz.kCGEventSourceStateHIDSystemState
+    )
+    # Character → keycode in the active keyboard layout, as pynput uses it
+    _layout_keycodes = get_unicode_to_keycode_map()
+except ImportError:
+    # Fall back to pynput for key events
+    Quartz = None
+    _event_source = None
+    _layout_keycodes = {}
+
 
 # ============================================================
 # CONSTANTS
@@ -51,6 +68,11 @@ except ImportError:
 APP_NAME = "Switch2 Bridge"
 INPUT_CHAR_UUID = "7492866c-ec3e-4619-8258-32755ffcc0f9"
 
+# Nintendo VID (0x057E) and Switch 2 Pro Controller PID (0x2069), as they
+# appear little-endian in the advertisement's manufacturer data
+NINTENDO_VID_SIG = b'\x7e\x05'
+SWITCH2_PRO_PID_SIG = b'\x69\x20'
+
 BUTTON_KEYS = {
     'A': 'z', 'B': 'x', 'X': 'c', 'Y': 'v',
     'L': 'q', 'R': 'e', 'ZL': '1', 'ZR': '3',
@@ -62,112 +84,263 @@ BUTTON_KEYS = {
 
 STICK_THRESHOLD = 0.5
 
+# Digital direction for every 12-bit raw stick value
+STICK_CENTER, STICK_POS, STICK_NEG = 0, 1, 2
+STICK_DIGITAL = bytes(
+    STICK_POS if (i - 2048) / 2048.0 > STICK_THRESHOLD else
+    STICK_NEG if (i - 2048) / 2048.0 < -STICK_THRESHOLD else
+    STICK_CENTER
+    for i in range(4096)
+)
+
+# Input report: 2 header bytes, 3 button bytes, 6 bytes of packed sticks
+_UNPACK_REPORT = struct.Struct('<2x3BIH').unpack_from
+
+# Bit position of each button in the 24-bit (byte2 << 16 | byte3 << 8 | byte4) mask
+BUTTON_BITS = {
+    'HOME': 0, 'GR': 2, 'GL': 3, 'CAPT': 4,
+    'DDOWN': 8, 'DRIGHT': 9, 'DLEFT': 10, 'DUP': 11,
+    'L': 12, 'ZL': 13, '-': 14, 'LS': 15,
+    'B': 16, 'A': 17, 'Y': 18, 'X': 19,
+    'R': 20, 'ZR': 21, '+': 22, 'RS': 23,
+}
+_BIT_NAMES = {bit: name for name, bit in BUTTON_BITS.items()}
+# Report bits that carry a button; the rest are ignored
+BUTTON_MASK = sum(1 << bit for bit in BUTTON_BITS.values())
+
+# Stick direction keys live above the buttons (bits 24-31): one 2-bit
+# STICK_DIGITAL field per axis, in LX, LY, RX, RY order
+STICK_BITS = {
+    'd': 24, 'a': 25,   # Left stick X
+    'w': 26, 's': 27,   # Left stick Y
+    'l': 28, 'j': 29,   # Right stick X
+    'i': 30, 'k': 31,   # Right stick Y
+}
+STICK_MASK = 0xFF << 24
+_STICK_KEYS = {bit: key for key, bit in STICK_BITS.items()}
+
+BIT_TO_KEY = tuple(
+    BUTTON_KEYS[_BIT_NAMES[bit]] if bit in _BIT_NAMES else _STICK_KEYS.get(bit)
+    for bit in range(32)
+)
+
+# macOS virtual keycodes for every key the bridge emits. Characters are
+# resolved through the active layout (so AZERTY/QWERTZ/Dvorak type the
+# same characters pynput would); special keys carry their own keycode.
+MAC_KEYCODES = {
+    key: _layout_keycodes.get(key) if isinstance(key, str) else key.value.vk
+    for key in BIT_TO_KEY if key is not None
+}
+
+# ============================================================
+# KEYBOARD OUTPUT
+# ============================================================
+
+def _key_action(key, down):
+    """Build a zero-argument callable that presses or releases key.
+
+    The output path (Quartz event or pynput) is chosen once here, so the
+    per-packet code only calls the result.
+    """
+    code = MAC_KEYCODES.get(key)
+    if _event_source is not None and code is not None:
+        create = Quartz.CGEventCreateKeyboardEvent
+        set_flags = Quartz.CGEventSetFlags
+        post = Quartz.CGEventPost
+        tap = Quartz.kCGHIDEventTap
+        source = _event_source
+
+        def action():
+            event = create(source, code, down)
+            # Like pynput: no modifiers, whatever the user is holding
+            set_flags(event, 0)
+            post(tap, event)
+        return action
+    return functools.partial(keyboard.press if down else keyboard.release, key)
+
+
+# Press/release actions per BIT_TO_KEY bit (None for unmapped bits)
+KEY_DOWN = tuple(None if key is None else _key_action(key, True) for key in BIT_TO_KEY)
+KEY_UP = tuple(None if key is None else _key_action(key, False) for key in BIT_TO_KEY)
+
+
+# ============================================================
+# INPUT REPORT DECODING
+# ============================================================
+
+def _decode_report(data, last_sticks, last_mask,
+                   _unpack=_UNPACK_REPORT, _digital=STICK_DIGITAL):
+    """Decode a report into (key bitmap, raw 48-bit stick word).
+
+    Stick directions are only re-derived when the raw stick bytes differ
+    from last_sticks; otherwise they are carried over from last_mask.
+    """
+    b2, b3, b4, sticks_lo, sticks_hi = _unpack(data)
+
+    # Four packed little-endian 12-bit values: LX, LY, RX, RY
+    u = sticks_lo | (sticks_hi << 32)
+    if u == last_sticks:
+        sticks = last_mask & STICK_MASK
+    else:
+        sticks = (
+            _digital[u & 0xFFF]
+            | (_digital[(u >> 12) & 0xFFF] << 2)
+            | (_digital[(u >> 24) & 0xFFF] << 4)
+            | (_digital[(u >> 36) & 0xFFF] << 6)
+        ) << 24
+
+    return (((b2 << 16) | (b3 << 8) | b4) & BUTTON_MASK) | sticks, u
+
 
 # ============================================================
 # CONTROLLER BRIDGE (from working ryujinx_bridge.py)
 # ============================================================
 
+# Immutable copy of the bridge state for the UI. Fields are read one by one
+# while the BLE thread runs, so it is a consistent value, not an atomic one.
+BridgeStatus = collections.namedtuple(
+    'BridgeStatus',
+    ['is_searching', 'is_connected', 'controller_name', 'packet_count'],
+)
+
+
 class ControllerBridge:
     """Handles BLE connection and keyboard input simulation."""
 
+    # Fixed attribute layout: _on_data updates these on every packet
+    __slots__ = (
+        'is_connected', 'is_searching', 'controller_name', 'packet_count',
+        '_pressed', '_prev_mask', '_last_sticks', '_client', '_stop_event',
+        '_latest', '_rx_evt', '_loop',
+    )
+
     def __init__(self):
         self.is_connected = False
         self.is_searching = False
         self.controller_name = None
         self.packet_count = 0
-        self.pressed_keys = set()
+        self._pressed = 0  # Keys held down, as a BIT_TO_KEY bitmap
+        self._prev_mask = 0
+        self._last_sticks = None
         self._client = None
         self._stop_event = threading.Event()
-
-    def _set_key(self, key, active):
-        """Set key state (from working code)."""
+        # Newest notification; _consume parses only this one per wakeup
+        self._latest = None
+        self._rx_evt = None
+        self._loop = None
+
+    def _set_key(self, index, bit, active):
+        """Set the state of the key at BIT_TO_KEY[index] (bit == 1 << index)."""
+        held = self._pressed & bit
         if active:
-            if key not in self.pressed_keys:
-                self.pressed_keys.add(key)
-                keyboard.press(key)
+            if not held:
+                self._pressed |= bit
+                KEY_DOWN[index]()
         else:
-            if key in self.pressed_keys:
-                self.pressed_keys.discard(key)
-                keyboard.release(key)
+            if held:
+                self._pressed &= ~bit
+                KEY_UP[index]()
 
-    def _on_data(self, sender, data: bytes):
-        """Parse controller data - EXACT COPY from working ryujinx_bridge.py"""
+    def _on_data(self, sender, data: bytearray):
+        """BLE notification callback: hand the packet over to _consume."""
         if len(data) < 11:
             return
-
         self.packet_count += 1
+        # bleak hands over a fresh bytearray per notification, so it is
+        # kept as-is (a single reference swap); struct.unpack_from reads
+        # it without a copy
+        self._latest = data
+        self._loop.call_soon_threadsafe(self._rx_evt.set)
+
+    async def _consume(self):
+        """Parse the newest packet so slow key events never stall BLE.
+
+        Reports carry the full controller state, so packets superseded
+        before the consumer wakes up are skipped rather than replayed.
+        """
+        rx_evt, parse = self._rx_evt, self._parse
+        last = None
+        while True:
+            await rx_evt.wait()
+            rx_evt.clear()
+            data = self._latest
+            if data is not last:
+                last = data
+                try:
+                    parse(data)
+                except Exception as e:
+                    # Keep consuming; one bad packet must not stop input
+                    print(f"Packet error: {e}")
+
+    def _parse(self, data: bytearray):
+        """Parse controller data and press/release the keys that changed."""
+        # === BUTTONS + STICK DIRECTIONS === only changed bits are visited
+        mask, self._last_sticks = _decode_report(
+            data, self._last_sticks, self._prev_mask
+        )
+        diff = mask ^ self._prev_mask
+        self._prev_mask = mask
+        if not diff:
+            return
 
-        # Button bytes
-        b2, b3, b4 = data[2], data[3], data[4]
-
-        # === FACE BUTTONS (byte 2) ===
-        self._set_key(BUTTON_KEYS['B'], b2 & 0x01)
-        self._set_key(BUTTON_KEYS['A'], b2 & 0x02)
-        self._set_key(BUTTON_KEYS['Y'], b2 & 0x04)
-        self._set_key(BUTTON_KEYS['X'], b2 & 0x08)
-        self._set_key(BUTTON_KEYS['R'], b2 & 0x10)
-        self._set_key(BUTTON_KEYS['ZR'], b2 & 0x20)
-        self._set_key(BUTTON_KEYS['+'], b2 & 0x40)
-        self._set_key(BUTTON_KEYS['RS'], b2 & 0x80)
-
-        # === D-PAD + LEFT TRIGGERS (byte 3) ===
-        self._set_key(BUTTON_KEYS['DDOWN'], b3 & 0x01)
-        self._set_key(BUTTON_KEYS['DRIGHT'], b3 & 0x02)
-        self._set_key(BUTTON_KEYS['DLEFT'], b3 & 0x04)
-        self._set_key(BUTTON_KEYS['DUP'], b3 & 0x08)
-        self._set_key(BUTTON_KEYS['L'], b3 & 0x10)
-        self._set_key(BUTTON_KEYS['ZL'], b3 & 0x20)
-        self._set_key(BUTTON_KEYS['-'], b3 & 0x40)
-        self._set_key(BUTTON_KEYS['LS'], b3 & 0x80)
-
-        # === SPECIAL BUTTONS (byte 4) ===
-        self._set_key(BUTTON_KEYS['HOME'], b4 & 0x01)
-        self._set_key(BUTTON_KEYS['GR'], b4 & 0x04)
-        self._set_key(BUTTON_KEYS['GL'], b4 & 0x08)
-        self._set_key(BUTTON_KEYS['CAPT'], b4 & 0x10)
-
-        # === ANALOG STICKS ===
-        lx_raw = data[5] | ((data[6] & 0x0F) << 8)
-        ly_raw = ((data[6] & 0xF0) >> 4) | (data[7] << 4)
-        rx_raw = data[8] | ((data[9] & 0x0F) << 8)
-        ry_raw = ((data[9] & 0xF0) >> 4) | (data[10] << 4)
-
-        lx = (lx_raw - 2048) / 2048.0
-        ly = (ly_raw - 2048) / 2048.0
-        rx = (rx_raw - 2048) / 2048.0
-        ry = (ry_raw - 2048) / 2048.0
-
-        # Left stick → WASD
-        self._set_key('w', ly > STICK_THRESHOLD)
-        self._set_key('s', ly < -STICK_THRESHOLD)
-        self._set_key('a', lx < -STICK_THRESHOLD)
-        self._set_key('d', lx > STICK_THRESHOLD)
-
-        # Right stick → IJKL
-        self._set_key('i', ry > STICK_THRESHOLD)
-        self._set_key('k', ry < -STICK_THRESHOLD)
-        self._set_key('j', rx < -STICK_THRESHOLD)
-        self._set_key('l', rx > STICK_THRESHOLD)
+        # Every bit left in the mask maps to a key
+        set_key = self._set_key
+        while diff:
+            lsb = diff & -diff
+            set_key(lsb.bit_length() - 1, lsb, mask & lsb)
+            diff ^= lsb
+
+    def status(self):
+        """Snapshot the current state as a BridgeStatus."""
+        return BridgeStatus(
+            self.is_searching, self.is_connected, self.controller_name,
+            self.packet_count,
+        )
 
     def _release_all_keys(self):
         """Release all pressed keys."""
-        for key in list(self.pressed_keys):
+        pressed = self._pressed
+        while pressed:
+            lsb = pressed & -pressed
             try:
-                keyboard.release(key)
+                KEY_UP[lsb.bit_length() - 1]()
             except:
                 pass
-        self.pressed_keys.clear()
+            pressed ^= lsb
+        self._pressed = 0
+        self._prev_mask = 0
+        self._last_sticks = None
+
+    @staticmethod
+    def _is_switch2_controller(adv):
+        """Check advertisement data for the Switch 2 Pro Controller IDs."""
+        manufacturer_data = adv.manufacturer_data
+        if not manufacturer_data:
+            return False
+        for data in manufacturer_data.values():
+            if NINTENDO_VID_SIG in data or SWITCH2_PRO_PID_SIG in data:
+                return True
+        return False
 
     async def _find_controller(self, timeout=5.0):
-        """Scan for Switch 2 Pro Controller."""
-        devices = await BleakScanner.discover(timeout=timeout, return_adv=True)
+        """Scan for Switch 2 Pro Controller, stopping as soon as one is seen."""
+        found = asyncio.Event()
+        result = []
 
-        for address, (device, adv) in devices.items():
-            if adv.manufacturer_data:
-                for company_id, data in adv.manufacturer_data.items():
-                    if b'\x7e\x05' in data or b'\x69\x20' in data:
-                        return address, device.name or "Switch 2 Pro Controller"
-        return None, None
+        def on_advertisement(device, adv):
+            if not found.is_set() and self._is_switch2_controller(adv):
+                result.append((device.address, device.name or "Switch 2 Pro Controller"))
+                found.set()
+
+        scanner = BleakScanner(detection_callback=on_advertisement)
+        await scanner.start()
+        try:
+            await asyncio.wait_for(found.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None, None
+        finally:
+            await scanner.stop()
+        return result[0]
 
     async def _connect_async(self):
         """Async connection routine."""
@@ -183,6 +356,10 @@ class ControllerBridge:
         self.is_searching = False
 
         # Connect
+        self._loop = asyncio.get_running_loop()
+        self._rx_evt = asyncio.Event()
+        self._latest = None
+        consumer = None
         try:
             self._client = BleakClient(address, timeout=30.0)
             await self._client.connect()
@@ -194,6 +371,7 @@ class ControllerBridge:
             self.is_connected = True
 
             # Start notifications
+            consumer = asyncio.ensure_future(self._consume())
             await self._client.start_notify(INPUT_CHAR_UUID, self._on_data)
 
             # Keep alive until stop requested or disconnected
@@ -207,10 +385,18 @@ class ControllerBridge:
 
         except Exception as e:
             print(f"Connection error: {e}")
+        finally:
+            if consumer:
+                consumer.cancel()
+                try:
+                    await consumer
+                except asyncio.CancelledError:
+                    pass
+
+            self._release_all_keys()
+            self.is_connected = False
+            self.controller_name = None
 
-        self._release_all_keys()
-        self.is_connected = False
-        self.controller_name = None
         return False
 
     def connect(self, callback=None):
@@ -243,17 +429,21 @@ class Switch2BridgeApp(rumps.App):
     def __init__(self):
         super().__init__(APP_NAME, title="🎮", quit_button=None)
         self.bridge = ControllerBridge()
+        self._last_status = None
         self._build_menu()
 
         # Status check timer
         self._timer = rumps.Timer(self._check_status, 1)
         self._timer.start()
 
-    def _build_menu(self):
-        """Build menu based on current state."""
+    def _build_menu(self, status=None):
+        """Build menu from a BridgeStatus (a fresh one if not given)."""
+        if status is None:
+            status = self.bridge.status()
+        self._last_status = status
         self.menu.clear()
 
-        if self.bridge.is_searching:
+        if status.is_searching:
             self.title = "🔍"
             self.menu = [
                 rumps.MenuItem("Searching...", callback=None),
@@ -261,11 +451,11 @@ class Switch2BridgeApp(rumps.App):
                 rumps.MenuItem("Quit", callback=self._quit),
             ]
 
-        elif self.bridge.is_connected:
+        elif status.is_connected:
             self.title = "🟢"
             self.menu = [
-                rumps.MenuItem(f"✓ {self.bridge.controller_name}", callback=None),
-                rumps.MenuItem(f"   {self.bridge.packet_count} packets", callback=None),
+                rumps.MenuItem(f"✓ {status.controller_name}", callback=None),
+                rumps.MenuItem(f"   {status.packet_count} packets", callback=None),
                 None,
                 rumps.MenuItem("Disconnect", callback=self._disconnect),
                 None,
@@ -285,8 +475,10 @@ class Switch2BridgeApp(rumps.App):
             ]
 
     def _check_status(self, _):
-        """Periodic status check to update menu."""
-        self._build_menu()
+        """Periodic status check to update menu (only when it changed)."""
+        status = self.bridge.status()
+        if status != self._last_status:
+            self._build_menu(status)
 
     def _connect(self, _):
         """Start connection."""